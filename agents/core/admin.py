@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+Admin-only HTTP routes, mounted on the FastAPI app by ``main.py``.
+
+Every route requires an ``X-Admin-Token`` header matching the ``ADMIN_TOKEN``
+environment variable; when ``ADMIN_TOKEN`` is unset the routes answer 404.
+"""
+
+import os
+import hmac
+import asyncio
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+
+from agents.core.profiler import profiler
+
+
+def require_admin(x_admin_token: str | None = Header(default=None)):
+    """校验管理员令牌，未配置 ADMIN_TOKEN 时禁用所有管理接口"""
+    admin_token = os.getenv("ADMIN_TOKEN")
+    if not admin_token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, admin_token):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+router = APIRouter(prefix="/admin", dependencies=[Depends(require_admin)])
+
+# 管理接口：采样分析器
+
+@router.post("/profiler/start")
+async def start_profiler(interval_ms: float = 10, duration_s: float = 30, session_id: str | None = None):
+    """启动采样分析器，在 duration_s 秒后自动停止"""
+    try:
+        return profiler.start(interval_ms=interval_ms, duration_s=duration_s, session_id=session_id)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@router.post("/profiler/stop")
+async def stop_profiler(top: int = 20):
+    """停止采样并返回折叠栈（可直接生成火焰图）和耗时最多的函数列表"""
+    return await asyncio.to_thread(profiler.stop, top)
+
+@router.get("/profiler")
+async def profiler_status():
+    """查看采样分析器状态"""
+    return profiler.status()
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+Resumable live sessions for the WebSocket endpoint.
+
+Each live run is owned by a ``LiveSession`` rather than by a single WebSocket
+connection. Outbound frames are tagged with an increasing ``seq`` and kept in
+a bounded replay buffer; when the client disconnects, the live run keeps going
+for a grace period. A client that reconnects with the last ``seq`` it saw gets
+the missed frames replayed before live streaming continues, so a dropped
+connection no longer restarts the model turn.
+
+Every attach starts with an unsequenced ``{"run_id": ..., "reset": ...}``
+frame. ``reset`` is true when the client asked to resume but the run it saw
+is gone (expired, or the server restarted): sequence numbers start over and
+the client must drop what it remembers about the previous run. Once a run
+has had a client, only connections presenting its ``run_id`` may attach to
+it, so guessing a session id is not enough to take over someone else's
+run or read its transcript. If the live
+run itself fails, the attached client gets an ``error`` frame, the
+connection is closed and the session is dropped so the next connection
+starts a new run.
+"""
+
+import os
+import hmac
+import json
+import uuid
+import asyncio
+from collections import deque
+
+REPLAY_BUFFER_SIZE = int(os.getenv("WS_REPLAY_BUFFER_SIZE", "1000"))
+SESSION_GRACE_PERIOD_S = float(os.getenv("WS_SESSION_GRACE_PERIOD_S", "60"))
+
+
+class LiveSession:
+    """A live agent run plus the outbound frames a client may still need."""
+
+    def __init__(self, session_id: str, live_events, live_request_queue):
+        self.session_id = session_id
+        self.run_id = uuid.uuid4().hex
+        self.live_events = live_events
+        self.live_request_queue = live_request_queue
+        self.websocket = None
+        self.pump_task: asyncio.Task | None = None
+        self._buffer: deque = deque(maxlen=REPLAY_BUFFER_SIZE)
+        self._next_seq = 1
+        # 保证回放与实时发送不会交错
+        self._send_lock = asyncio.Lock()
+        self._expiry_task: asyncio.Task | None = None
+        self._attached_once = False
+        self._ended = False
+
+    def start_pump(self, coro, on_end):
+        """Runs the agent-to-client coroutine and calls on_end(self) if it stops on its own."""
+        self.pump_task = asyncio.create_task(coro)
+        self.pump_task.add_done_callback(lambda task: self._on_pump_done(task, on_end))
+
+    def _on_pump_done(self, task: asyncio.Task, on_end):
+        if task.cancelled():
+            # close() 主动取消，无需处理
+            return
+        error = task.exception()
+        print(f"Session {self.session_id} live run ended: {error!r}")
+        self._ended = True
+        self._cancel_expiry()
+        self.live_request_queue.close()
+        on_end(self)
+        asyncio.create_task(self._end_client(error))
+
+    async def _end_client(self, error: BaseException | None):
+        """Tells the attached client that the live run is over and closes its connection."""
+        async with self._send_lock:
+            websocket = self.websocket
+            self.websocket = None
+            if websocket is None:
+                return
+            try:
+                await websocket.send_text(json.dumps({
+                    "error": str(error) if error else "Live run ended",
+                    "run_id": self.run_id,
+                }))
+                await websocket.close(code=1011)
+            except Exception as e:
+                print(f"Session {self.session_id} failed to notify client: {e}")
+
+    async def send(self, message: dict):
+        """Tags a message with the next seq, buffers it and sends it if a client is attached."""
+        async with self._send_lock:
+            frame = json.dumps({"seq": self._next_seq, **message})
+            self._buffer.append((self._next_seq, frame))
+            self._next_seq += 1
+            if self.websocket is not None:
+                try:
+                    await self.websocket.send_text(frame)
+                except Exception as e:
+                    # 连接已断开，帧保留在缓冲区中等待重连回放
+                    print(f"Session {self.session_id} send failed, detaching client: {e}")
+                    self.websocket = None
+
+    async def attach(self, websocket, last_seq: int | None = None, run_id: str | None = None):
+        """Attaches a client and replays every buffered frame after last_seq.
+
+        A last_seq sent to a run that has never had a client belongs to an
+        earlier run and is answered with a reset and a full replay. Once the
+        run has had a client, attaching requires its run_id; otherwise
+        PermissionError is raised and nothing about the run is changed.
+        """
+        if self._attached_once and not self.can_resume(run_id):
+            raise PermissionError(f"run_id does not match the live run of session {self.session_id}")
+        self._cancel_expiry()
+
+        async with self._send_lock:
+            previous = self.websocket
+            if previous is not None and previous is not websocket:
+                try:
+                    await previous.close()
+                except Exception:
+                    pass
+
+            reset = last_seq is not None and not self._attached_once
+            if reset or last_seq is None:
+                last_seq = 0
+            self._attached_once = True
+            await websocket.send_text(json.dumps({"run_id": self.run_id, "reset": reset}))
+
+            oldest_seq = self._buffer[0][0] if self._buffer else self._next_seq
+            if last_seq + 1 < oldest_seq:
+                # 缓冲区已覆盖部分客户端未收到的帧
+                await websocket.send_text(json.dumps({
+                    "replay_gap": True,
+                    "missed_from": last_seq + 1,
+                    "missed_to": oldest_seq - 1,
+                }))
+            replayed = 0
+            for seq, frame in self._buffer:
+                if seq > last_seq:
+                    await websocket.send_text(frame)
+                    replayed += 1
+            self.websocket = websocket
+        print(f"Session {self.session_id} attached, replayed {replayed} frames after seq {last_seq}")
+
+    def can_resume(self, run_id: str | None) -> bool:
+        """Checks whether a client presented the id of this run."""
+        return run_id is not None and hmac.compare_digest(run_id.encode("utf-8"), self.run_id.encode("utf-8"))
+
+    def detach(self, websocket, on_expire):
+        """Detaches a client and schedules on_expire after the grace period."""
+        if self.websocket is websocket:
+            self.websocket = None
+        if self.websocket is None and self._expiry_task is None and not self._ended:
+            self._expiry_task = asyncio.create_task(self._expire_later(on_expire))
+
+    async def _expire_later(self, on_expire):
+        await asyncio.sleep(SESSION_GRACE_PERIOD_S)
+        self._expiry_task = None
+        on_expire(self)
+
+    def _cancel_expiry(self):
+        if self._expiry_task is not None:
+            self._expiry_task.cancel()
+            self._expiry_task = None
+
+    def close(self):
+        """Stops the live run."""
+        self._cancel_expiry()
+        if self.pump_task is not None:
+            self.pump_task.cancel()
+        self.live_request_queue.close()
+
+
+class LiveSessionRegistry:
+    """Tracks live sessions that are connected or within their grace period."""
+
+    def __init__(self):
+        self._sessions: dict[str, LiveSession] = {}
+
+    def get(self, session_id: str) -> LiveSession | None:
+        return self._sessions.get(session_id)
+
+    def add(self, live_session: LiveSession):
+        self._sessions[live_session.session_id] = live_session
+
+    def discard(self, live_session: LiveSession):
+        """Forgets a session so the next connection starts a new run."""
+        if self._sessions.get(live_session.session_id) is live_session:
+            del self._sessions[live_session.session_id]
+
+    def expire(self, live_session: LiveSession):
+        """Closes a session whose client did not reconnect in time."""
+        self.discard(live_session)
+        live_session.close()
+        print(f"Session {live_session.session_id} expired after {SESSION_GRACE_PERIOD_S}s without a client")
+
+
+live_sessions = LiveSessionRegistry()
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+"""
+On-demand sampling profiler for the running web server.
+
+Nothing is hooked into the interpreter, so the overhead is bounded by the
+sampling interval and the profiler can be started and stopped under live
+traffic. Samples are taken in two ways:
+
+* The event loop thread is sampled from a ``SIGPROF`` handler armed with
+  ``signal.setitimer(ITIMER_PROF)``. The handler runs on the loop thread
+  itself, so short CPU bursts between awaits (JSON encoding, event handling)
+  are caught, and idle time spent in ``select`` is not counted at all. This
+  needs the loop to run on the main thread of a Unix process, which is how
+  uvicorn runs.
+* Other threads (``asyncio.to_thread`` workers, the ADK runner's helpers) are
+  sampled from a background thread with ``sys._current_frames()``.
+
+When the signal timer is not available, the loop thread is sampled from the
+background thread as well. That thread only gets the GIL when the loop
+releases it, mostly inside ``select``, so short CPU bursts are under-sampled.
+The switch interval is lowered while profiling to reduce this bias, and the
+report says which mode was used.
+
+Samples can be restricted to a single session: ``main.py`` binds
+``current_session_id`` before creating the WebSocket tasks of a session, every
+task (including ones spawned later by the ADK runner) inherits that context,
+and only event-loop samples whose running task carries the requested session
+id are kept.
+"""
+
+import asyncio
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+# 当前协程所属的会话ID，由 WebSocket 端点设置并被子任务继承
+current_session_id: ContextVar[str | None] = ContextVar("current_session_id", default=None)
+
+MIN_INTERVAL_MS = 1
+MAX_DURATION_S = 300
+MAX_STACK_DEPTH = 128
+MAX_DISTINCT_STACKS = 20000
+
+MODE_SIGNAL = "signal"
+MODE_THREAD = "thread"
+THREAD_MODE_NOTE = (
+    "The event loop thread was sampled from a background thread, which only runs "
+    "when the loop releases the GIL; short CPU bursts on the loop are under-sampled."
+)
+
+
+def _frame_label(frame) -> str:
+    """Formats a frame as ``function (file:line)`` for collapsed stacks."""
+    code = frame.f_code
+    return f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})"
+
+
+def _collapse(frame) -> str:
+    """Builds a root-first, semicolon separated stack for one frame chain."""
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return ";".join(labels)
+
+
+def _signal_sampling_available() -> bool:
+    """SIGPROF handlers can only be installed from the main thread on Unix."""
+    return hasattr(signal, "setitimer") and threading.current_thread() is threading.main_thread()
+
+
+class SamplingProfiler:
+    """Collects stack samples for a bounded time window."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._stop_event = threading.Event()
+        # 信号处理函数只在事件循环线程中写入 _loop_stacks，采样线程只写入 _thread_stacks
+        self._loop_stacks: Counter = Counter()
+        self._thread_stacks: Counter = Counter()
+        self._loop_samples = 0
+        self._thread_samples = 0
+        self._dropped = 0
+        self._session_id: str | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._loop_thread_id: int | None = None
+        self._interval = 0.0
+        self._mode = MODE_THREAD
+        self._signal_active = False
+        self._signal_handler_installed = False
+        self._previous_switch_interval: float | None = None
+        self._started_at: float | None = None
+        self._stopped_at: float | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def samples(self) -> int:
+        return self._loop_samples + self._thread_samples
+
+    def start(self, interval_ms: float = 10, duration_s: float = 30,
+              session_id: str | None = None) -> dict:
+        """Starts sampling; must be called from the event loop thread."""
+        with self._lock:
+            if self.running:
+                raise RuntimeError("Profiler is already running")
+
+            self._interval = max(float(interval_ms), MIN_INTERVAL_MS) / 1000
+            duration_s = min(max(float(duration_s), 0), MAX_DURATION_S)
+            self._loop_stacks = Counter()
+            self._thread_stacks = Counter()
+            self._loop_samples = 0
+            self._thread_samples = 0
+            self._dropped = 0
+            self._session_id = session_id
+            self._loop = asyncio.get_running_loop()
+            self._loop_thread_id = threading.get_ident()
+            self._started_at = time.monotonic()
+            self._stopped_at = None
+            self._stop_event = threading.Event()
+
+            if _signal_sampling_available():
+                self._mode = MODE_SIGNAL
+                self._arm_signal_timer()
+            else:
+                self._mode = MODE_THREAD
+                # 降低切换间隔，让采样线程更频繁地拿到 GIL
+                self._previous_switch_interval = sys.getswitchinterval()
+                sys.setswitchinterval(min(self._previous_switch_interval, self._interval / 10))
+
+            self._thread = threading.Thread(
+                target=self._run, args=(duration_s,), name="sampling-profiler", daemon=True
+            )
+            self._thread.start()
+            print(f"[PROFILER] started (mode={self._mode}, interval={interval_ms}ms, "
+                  f"duration={duration_s}s, session={session_id})")
+            return self.status()
+
+    def stop(self, top: int = 20) -> dict:
+        """Stops sampling (if still running) and returns the collected report."""
+        thread = self._thread
+        self._stop_event.set()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        print(f"[PROFILER] stopped ({self.samples} samples)")
+        return self.report(top=top)
+
+    def status(self) -> dict:
+        end = self._stopped_at or time.monotonic()
+        status = {
+            "running": self.running,
+            "mode": self._mode,
+            "session_id": self._session_id,
+            "interval_ms": self._interval * 1000,
+            "elapsed_s": round(end - self._started_at, 3) if self._started_at else 0.0,
+            "samples": self.samples,
+            "dropped_samples": self._dropped,
+        }
+        if self._mode == MODE_THREAD:
+            status["note"] = THREAD_MODE_NOTE
+        return status
+
+    def report(self, top: int = 20) -> dict:
+        """Returns collapsed stacks (flamegraph input) and a top-N table."""
+        stacks = self._loop_stacks + self._thread_stacks
+        self_counts: Counter = Counter()
+        total_counts: Counter = Counter()
+        for stack, count in stacks.items():
+            labels = stack.split(";")
+            self_counts[labels[-1]] += count
+            # 递归调用在同一栈中只计一次
+            for label in set(labels):
+                total_counts[label] += count
+
+        samples = sum(stacks.values()) or 1
+        top_functions = [
+            {
+                "function": label,
+                "self": count,
+                "total": total_counts[label],
+                "self_pct": round(100 * count / samples, 2),
+                "total_pct": round(100 * total_counts[label] / samples, 2),
+            }
+            for label, count in self_counts.most_common(top)
+        ]
+        collapsed = "\n".join(f"{stack} {count}" for stack, count in stacks.most_common())
+        return {**self.status(), "collapsed": collapsed, "top": top_functions}
+
+    def _arm_signal_timer(self):
+        if not self._signal_handler_installed:
+            # 处理函数安装后不再卸载：停止时只解除计时器，避免恢复默认的 SIGPROF 行为（终止进程）
+            signal.signal(signal.SIGPROF, self._handle_sigprof)
+            self._signal_handler_installed = True
+        self._signal_active = True
+        signal.setitimer(signal.ITIMER_PROF, self._interval, self._interval)
+
+    def _disarm_signal_timer(self):
+        self._signal_active = False
+        signal.setitimer(signal.ITIMER_PROF, 0)
+
+    def _handle_sigprof(self, signum, frame):
+        """Records the interrupted stack of the event loop thread."""
+        if not self._signal_active or frame is None:
+            return
+        if self._session_id is not None and not self._session_matches():
+            return
+        if self._record(self._loop_stacks, _collapse(frame)):
+            self._loop_samples += 1
+
+    def _session_matches(self) -> bool:
+        """Checks whether the task running on the event loop belongs to the session."""
+        # 采样线程中只读取事件循环当前运行的任务，不做任何修改
+        task = asyncio.current_task(self._loop)
+        if task is None:
+            return False
+        return task.get_context().get(current_session_id) == self._session_id
+
+    def _record(self, stacks: Counter, stack: str) -> bool:
+        if stack not in stacks and len(stacks) >= MAX_DISTINCT_STACKS:
+            self._dropped += 1
+            return False
+        stacks[stack] += 1
+        return True
+
+    def _run(self, duration_s: float):
+        deadline = time.monotonic() + duration_s
+        own_thread_id = threading.get_ident()
+        try:
+            while not self._stop_event.is_set() and time.monotonic() < deadline:
+                self._sample(own_thread_id)
+                self._stop_event.wait(self._interval)
+        finally:
+            if self._mode == MODE_SIGNAL:
+                self._disarm_signal_timer()
+            elif self._previous_switch_interval is not None:
+                sys.setswitchinterval(self._previous_switch_interval)
+                self._previous_switch_interval = None
+            self._stopped_at = time.monotonic()
+
+    def _sample(self, own_thread_id: int):
+        frames = sys._current_frames()
+        for thread_id, frame in frames.items():
+            if thread_id == own_thread_id:
+                continue
+            if thread_id == self._loop_thread_id:
+                # 信号模式下事件循环线程由 SIGPROF 处理函数采样
+                if self._mode == MODE_SIGNAL:
+                    continue
+                if self._session_id is not None and not self._session_matches():
+                    continue
+            elif self._session_id is not None:
+                continue
+            if self._record(self._thread_stacks, _collapse(frame)):
+                self._thread_samples += 1
+
+
+profiler = SamplingProfiler()
@@ -7,20 +7,25 @@ TASK_ASSIGNMENT_INSTRUCTION = """
 
 你的步骤如下：
 1. 从会话状态中获取任务详情。
-2. 使用`get_notion_database_properties`工具（如果需要）获取任务数据库的属性结构。
-3. 使用`find_notion_project`工具根据项目名称查找项目ID。
-4. 使用`create_notion_task`工具在Notion任务数据库中创建一个新页面，包含提供的任务详情和找到的项目ID。
-5. 将任务创建的结果报告给用户或调用代理。
+2. 如果任务需要关联到某个项目，优先使用`create_notion_task_in_project`工具，一次调用即可完成项目查找和任务创建：
+   传入任务数据库ID、项目数据库ID、项目名称以及以属性名称为键的任务属性值（无需自行格式化）。
+   工具会自动把找到的项目ID写入指向项目数据库的关联属性，并返回包含`status`、`task_id`、`url`等字段的结果。
+   如果返回的`project_linked`为false，说明任务数据库中没有指向项目数据库的关联属性，任务未关联到项目，请告知用户。
+   如果返回的`status`为`project_not_found`，请告知用户未找到该项目并确认项目名称。
+   较长的任务描述、会议记录或需求文档请通过`body`参数写入页面正文，不要放进属性中；没有正文时传入空字符串。
+   如果返回的`status`为`partial`，说明任务已创建但正文未写完，请使用`append_notion_page_body`工具，
+   传入相同的正文和返回的`resume_from_block`继续写入。
+3. 只有在不需要关联项目，或需要单独排查问题时，才依次使用`get_notion_database_schema`、`find_notion_project`和`create_notion_task`工具。
+   `create_notion_task`同样通过`body`参数写入页面正文（没有正文时传入空字符串），返回结果中的`status`和`resume_from_block`含义与上面相同。
+4. 将任务创建的结果报告给用户或调用代理。
 
 确保处理潜在的错误，例如未找到项目或数据库属性结构不匹配等情况。
 
-根据任务数据库的属性结构，你需要正确格式化要创建的任务数据。例如：
-- 标题属性需要格式化为：{"title": [{"text": {"content": "任务标题"}}]}
-- 富文本属性需要格式化为：{"rich_text": [{"text": {"content": "任务描述"}}]}
-- 关联属性需要格式化为：{"relation": [{"id": "项目ID"}]}
-- 状态属性需要格式化为：{"status": {"name": "状态名称"}}
-
-根据接收到的任务数据和数据库结构，灵活调整创建任务的属性格式。
+传给工具的任务属性以属性名称为键，值直接使用普通值，工具会根据任务数据库的属性结构自动转换为Notion格式，不要自行构造Notion格式的对象。例如：
+- 标题、富文本、状态、单选属性：直接传字符串，如 "任务标题"、"待处理"
+- 关联属性：传页面ID字符串或页面ID列表
+- 日期属性：传 {"start": "2023-08-15", "end": "2023-08-20"}（end可省略）
+- 复选框属性：传 true 或 false
 """
 
 # TODO: 根据任务详情在状态中的确切结构和工具函数签名进一步完善此指令。
@@ -1,10 +1,22 @@
 import os
+import json
+import asyncio
+import httpx
 from notion_client import Client
+from notion_client.errors import HTTPResponseError, RequestTimeoutError
 from google.adk.tools import ToolContext
 
 # Global client instance (or initialize within functions if preferred)
 _notion_client = None
 
+# Notion API 限制
+MAX_RICH_TEXT_CONTENT = 2000  # 单个 rich_text 对象的字符上限（按 UTF-16 码元计）
+MAX_RICH_TEXT_SEGMENTS = 100  # 单个属性或块中 rich_text 数组的长度上限
+MAX_BLOCKS_PER_REQUEST = 100  # 单次创建/追加请求的子块数量上限
+MAX_REQUEST_BYTES = 400_000  # 留出余量，低于 Notion 500KB 的请求体上限
+BLOCK_APPEND_RETRIES = 3
+BLOCK_APPEND_BACKOFF_S = 1.0  # 重试退避基数，第 n 次重试前等待 BACKOFF * 2**n 秒
+
 def _get_notion_client():
     """Initializes and returns the Notion client."""
     global _notion_client
@@ -15,19 +27,241 @@ def _get_notion_client():
         _notion_client = Client(auth=notion_api_key)
     return _notion_client
 
+def _retrieve_database_schema(database_id: str) -> dict:
+    """Retrieves a Notion database and returns its raw property definitions."""
+    client = _get_notion_client()
+    # 调用Notion API获取数据库信息
+    database = client.databases.retrieve(database_id=database_id)
+    return database.get('properties', {})
+
+def _property_types(schema: dict) -> dict:
+    """Maps each property name of a raw schema to its type."""
+    # 从响应中提取属性名称和类型
+    properties = {}
+    for prop_name, prop_details in schema.items():
+        prop_type = prop_details.get('type')
+        properties[prop_name] = prop_type
+    return properties
+
+def _retrieve_database_properties(database_id: str) -> dict:
+    """Retrieves a Notion database and maps each property name to its type."""
+    return _property_types(_retrieve_database_schema(database_id))
+
+def _normalize_id(notion_id: str) -> str:
+    """Normalizes a Notion id so dashed and undashed forms compare equal."""
+    return notion_id.replace("-", "").lower()
+
+def _find_relation_to_database(schema: dict, database_id: str) -> str | None:
+    """Returns the relation property of a raw schema that targets database_id."""
+    target = _normalize_id(database_id)
+    for prop_name, prop_details in schema.items():
+        if prop_details.get('type') != "relation":
+            continue
+        related_database_id = prop_details.get('relation', {}).get('database_id') or ""
+        if _normalize_id(related_database_id) == target:
+            return prop_name
+    return None
+
+def _find_property_by_type(properties: dict, prop_type: str) -> str | None:
+    """Returns the name of the first property with the given type."""
+    return next((prop_name for prop_name, current_type in properties.items()
+                 if current_type == prop_type), None)
+
+def _query_project_page_id(project_database_id: str, title_property: str, project_name: str) -> str | None:
+    """Queries the project database for a page whose title equals project_name."""
+    client = _get_notion_client()
+    # 构建查询过滤条件
+    filter_params = {
+        "property": title_property,
+        "title": {
+            "equals": project_name
+        }
+    }
+
+    # 查询数据库
+    response = client.databases.query(
+        database_id=project_database_id,
+        filter=filter_params
+    )
+
+    # 检查是否有匹配的项目
+    results = response.get("results", [])
+    if results:
+        return results[0].get("id")
+    return None
+
+def _json_size(payload) -> int:
+    """Returns the UTF-8 size of a payload once serialized as JSON."""
+    return len(json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+
+def _utf16_prefix_length(text: str, limit: int) -> int:
+    """Returns how many characters of text fit in limit UTF-16 code units.
+
+    Characters outside the BMP take two code units and are never split, so
+    a chunk cannot end in the middle of a surrogate pair.
+    """
+    units = 0
+    for index, char in enumerate(text):
+        units += 2 if ord(char) > 0xFFFF else 1
+        if units > limit:
+            return index
+    return len(text)
+
+def _split_text(text: str, limit: int = MAX_RICH_TEXT_CONTENT) -> list[str]:
+    """Splits text into chunks of at most limit UTF-16 code units.
+
+    Notion measures content length in UTF-16 code units. Chunks break at the
+    last newline or space in the window when one exists in its second half,
+    so joining the chunks gives back the original text.
+    """
+    chunks = []
+    while text:
+        fit = _utf16_prefix_length(text, limit)
+        if fit == len(text):
+            chunks.append(text)
+            break
+        window = text[:fit]
+        cut = max(window.rfind("\n"), window.rfind(" ")) + 1
+        if cut <= fit // 2:
+            cut = fit
+        chunks.append(text[:cut])
+        text = text[cut:]
+    return chunks
+
+def _rich_text_segments(text: str) -> list[dict]:
+    """Builds a rich_text array whose segments respect Notion's size limits."""
+    segments = [{"text": {"content": chunk}} for chunk in _split_text(text)]
+    if len(segments) > MAX_RICH_TEXT_SEGMENTS or _json_size(segments) > MAX_REQUEST_BYTES:
+        raise ValueError(
+            f"Text of {len(text)} characters exceeds the size Notion accepts for a rich text "
+            f"property; put it in the page body instead"
+        )
+    return segments
+
+def _paragraph_blocks(body: str) -> list[dict]:
+    """Converts body text into paragraph blocks, one per chunk of each paragraph."""
+    blocks = []
+    for paragraph in body.split("\n\n"):
+        paragraph = paragraph.strip("\n")
+        if not paragraph:
+            continue
+        for chunk in _split_text(paragraph):
+            blocks.append({
+                "object": "block",
+                "type": "paragraph",
+                "paragraph": {"rich_text": [{"type": "text", "text": {"content": chunk}}]},
+            })
+    return blocks
+
+def _next_batch_end(blocks: list[dict], start: int, max_bytes: int = MAX_REQUEST_BYTES) -> int:
+    """Returns the end index of the request batch starting at start.
+
+    max_bytes is the payload budget left for blocks; when the batch shares
+    a request with other data it may leave room for no blocks at all.
+    """
+    end = start
+    size = 0
+    while end < len(blocks) and end - start < MAX_BLOCKS_PER_REQUEST:
+        block_size = _json_size(blocks[end])
+        if size + block_size > max_bytes:
+            break
+        size += block_size
+        end += 1
+    return end
+
+def _is_retryable_error(error: Exception) -> bool:
+    """Rate limits, server errors, timeouts and transport failures are worth retrying."""
+    # notion-client 只包装超时，连接重置、DNS 失败等传输错误会原样抛出
+    if isinstance(error, (RequestTimeoutError, httpx.TransportError)):
+        return True
+    if isinstance(error, HTTPResponseError):
+        return error.status == 429 or error.status >= 500
+    return False
+
+async def _append_blocks(page_id: str, blocks: list[dict], start: int = 0) -> tuple[int, str | None]:
+    """Appends blocks[start:] to a page in order, batch by batch.
+
+    Appends to one parent must stay sequential to keep the block order, so
+    each batch is sent as soon as the previous one is acknowledged. Rate
+    limits, server errors, timeouts and transport failures are retried with
+    backoff; any other
+    error stops immediately. Returns the number of blocks written so far
+    and the last error, if any; the count is where a retry resumes.
+    """
+    client = _get_notion_client()
+    written = start
+    while written < len(blocks):
+        end = _next_batch_end(blocks, written)
+        for attempt in range(BLOCK_APPEND_RETRIES):
+            try:
+                await asyncio.to_thread(
+                    client.blocks.children.append, block_id=page_id, children=blocks[written:end]
+                )
+                break
+            except Exception as e:
+                print(f"Error appending blocks {written}-{end} to page {page_id} (attempt {attempt + 1}): {e}")
+                if not _is_retryable_error(e) or attempt == BLOCK_APPEND_RETRIES - 1:
+                    return written, str(e)
+                await asyncio.sleep(BLOCK_APPEND_BACKOFF_S * 2 ** attempt)
+        written = end
+    return written, None
+
+def _format_task_properties(db_properties: dict, properties: dict) -> dict:
+    """Formats plain property values into the Notion API payload shape."""
+    formatted_properties = {}
+
+    # 根据不同属性类型格式化数据
+    for prop_name, prop_value in properties.items():
+        if prop_name not in db_properties:
+            print(f"Warning: Property '{prop_name}' not found in database schema")
+            continue
+
+        prop_type = db_properties[prop_name]
+
+        # 根据属性类型格式化
+        if prop_type == "title":
+            formatted_properties[prop_name] = {
+                "title": _rich_text_segments(str(prop_value))
+            }
+        elif prop_type == "rich_text":
+            formatted_properties[prop_name] = {
+                "rich_text": _rich_text_segments(str(prop_value))
+            }
+        elif prop_type == "status":
+            formatted_properties[prop_name] = {
+                "status": {"name": str(prop_value)}
+            }
+        elif prop_type == "relation" and isinstance(prop_value, str):
+            formatted_properties[prop_name] = {
+                "relation": [{"id": prop_value}]
+            }
+        elif prop_type == "relation" and isinstance(prop_value, list):
+            formatted_properties[prop_name] = {
+                "relation": [{"id": item} for item in prop_value]
+            }
+        elif prop_type == "select":
+            formatted_properties[prop_name] = {
+                "select": {"name": str(prop_value)}
+            }
+        elif prop_type == "date" and isinstance(prop_value, dict):
+            formatted_properties[prop_name] = {
+                "date": prop_value  # 假设已经是正确格式: {"start": "2023-08-15", "end": "2023-08-20"}
+            }
+        elif prop_type == "checkbox" and isinstance(prop_value, bool):
+            formatted_properties[prop_name] = {
+                "checkbox": prop_value
+            }
+        else:
+            # 对于其他类型，尝试按照一般格式
+            formatted_properties[prop_name] = {
+                prop_type: prop_value
+            }
+    return formatted_properties
+
 async def get_notion_database_schema(tool_context: ToolContext, database_id: str) -> dict:
     """Gets the properties of a Notion database."""
-    client = _get_notion_client()
     try:
-        # 调用Notion API获取数据库信息
-        database = client.databases.retrieve(database_id=database_id)
-        
-        # 从响应中提取属性名称和类型
-        properties = {}
-        for prop_name, prop_details in database.get('properties', {}).items():
-            prop_type = prop_details.get('type')
-            properties[prop_name] = prop_type
-            
+        properties = _retrieve_database_properties(database_id)
         print(f"Successfully retrieved properties for database ID: {database_id}")
         return properties
     except Exception as e:
@@ -37,35 +271,17 @@ async def get_notion_database_schema(tool_context: ToolContext, database_id: str
 
 async def find_notion_project(tool_context: ToolContext, project_database_id: str, project_name: str) -> str | None:
     """Finds a project page in the project database by name."""
-    client = _get_notion_client()
     try:
         # 构建查询过滤条件 - 假设项目名称存储在标题属性中
         # 首先获取数据库属性，找到标题属性的名称
         properties = await get_notion_database_schema(tool_context, project_database_id)
-        title_property = next((prop_name for prop_name, prop_type in properties.items() 
-                              if prop_type == "title"), None)
-        
+        title_property = _find_property_by_type(properties, "title")
+
         if not title_property:
             raise ValueError("Could not find title property in the database")
-        
-        # 构建查询过滤条件
-        filter_params = {
-            "property": title_property,
-            "title": {
-                "equals": project_name
-            }
-        }
-        
-        # 查询数据库
-        response = client.databases.query(
-            database_id=project_database_id,
-            filter=filter_params
-        )
-        
-        # 检查是否有匹配的项目
-        results = response.get("results", [])
-        if results:
-            project_page_id = results[0].get("id")
+
+        project_page_id = _query_project_page_id(project_database_id, title_property, project_name)
+        if project_page_id:
             print(f"Found project '{project_name}' with ID: {project_page_id}")
             return project_page_id
         else:
@@ -75,81 +291,164 @@ async def find_notion_project(tool_context: ToolContext, project_database_id: st
         print(f"Error finding project: {e}")
         return None
 
-async def create_notion_task(tool_context: ToolContext, task_database_id: str, properties: dict):
-    """Creates a new task page in the task database."""
+def _body_result(blocks: list[dict], written: int, error: str | None) -> dict:
+    """Builds the body-writing fields shared by every tool that writes a page body."""
+    result = {
+        "status": "success" if error is None else "partial",
+        "body_blocks_total": len(blocks),
+        "body_blocks_written": written,
+    }
+    if error is not None:
+        result["resume_from_block"] = written
+        result["error"] = error
+    return result
+
+async def _create_page_with_body(database_id: str, formatted_properties: dict, body: str) -> dict:
+    """Creates a page and writes body as paragraph blocks.
+
+    The first batch of blocks is sent with the page creation request, within
+    the byte budget left after the properties, and the rest is appended
+    afterwards. Returns the page id and url plus the body-writing fields of
+    _body_result.
+    """
     client = _get_notion_client()
+    blocks = _paragraph_blocks(body) if body else []
+    # 第一批块与属性共用同一个请求体，需扣除属性占用的大小
+    properties_size = _json_size(formatted_properties)
+    if properties_size > MAX_REQUEST_BYTES:
+        raise ValueError(
+            f"Task properties take {properties_size} bytes, over the {MAX_REQUEST_BYTES} byte request budget"
+        )
+    first_batch_end = _next_batch_end(blocks, 0, MAX_REQUEST_BYTES - properties_size)
+    create_kwargs = {"children": blocks[:first_batch_end]} if first_batch_end else {}
+    response = await asyncio.to_thread(
+        client.pages.create,
+        parent={"database_id": database_id},
+        properties=formatted_properties,
+        **create_kwargs,
+    )
+    print(f"任务已成功创建，页面链接: {response.get('url')}")
+
+    page_id = response.get("id")
+    written, error = await _append_blocks(page_id, blocks, first_batch_end)
+    return {"task_id": page_id, "url": response.get("url"), **_body_result(blocks, written, error)}
+
+async def create_notion_task(tool_context: ToolContext, task_database_id: str, properties: dict, body: str) -> dict:
+    """Creates a new task page in the task database.
+
+    A non-empty body is written to the page as paragraph blocks. If writing
+    it fails part way, the result has status "partial" and the block index
+    to pass to append_notion_page_body to resume.
+    """
     try:
-        # 构建适合Notion API的属性格式
-        formatted_properties = {}
-        
         # 获取数据库属性以了解每个字段的类型
         db_properties = await get_notion_database_schema(tool_context, task_database_id)
-        
-        # 根据不同属性类型格式化数据
-        for prop_name, prop_value in properties.items():
-            if prop_name not in db_properties:
-                print(f"Warning: Property '{prop_name}' not found in database schema")
-                continue
-                
-            prop_type = db_properties[prop_name]
-            
-            # 根据属性类型格式化
-            if prop_type == "title":
-                formatted_properties[prop_name] = {
-                    "title": [{"text": {"content": str(prop_value)}}]
-                }
-            elif prop_type == "rich_text":
-                formatted_properties[prop_name] = {
-                    "rich_text": [{"text": {"content": str(prop_value)}}]
-                }
-            elif prop_type == "status":
-                formatted_properties[prop_name] = {
-                    "status": {"name": str(prop_value)}
-                }
-            elif prop_type == "relation" and isinstance(prop_value, str):
-                formatted_properties[prop_name] = {
-                    "relation": [{"id": prop_value}]
-                }
-            elif prop_type == "relation" and isinstance(prop_value, list):
-                formatted_properties[prop_name] = {
-                    "relation": [{"id": item} for item in prop_value]
-                }
-            elif prop_type == "select":
-                formatted_properties[prop_name] = {
-                    "select": {"name": str(prop_value)}
-                }
-            elif prop_type == "date" and isinstance(prop_value, dict):
-                formatted_properties[prop_name] = {
-                    "date": prop_value  # 假设已经是正确格式: {"start": "2023-08-15", "end": "2023-08-20"}
-                }
-            elif prop_type == "checkbox" and isinstance(prop_value, bool):
-                formatted_properties[prop_name] = {
-                    "checkbox": prop_value
-                }
-            else:
-                # 对于其他类型，尝试按照一般格式
-                formatted_properties[prop_name] = {
-                    prop_type: prop_value
-                }
-        
-        # 创建页面
-        response = client.pages.create(
-            parent={"database_id": task_database_id},
-            properties=formatted_properties
+
+        # 构建适合Notion API的属性格式
+        formatted_properties = _format_task_properties(db_properties, properties)
+
+        # 创建页面并写入正文
+        result = await _create_page_with_body(task_database_id, formatted_properties, body)
+        result["skipped_properties"] = [name for name in properties if name not in db_properties]
+        return result
+    except Exception as e:
+        print(f"创建任务时出错: {e}")
+        raise ValueError(f"无法创建任务: {e}")
+
+async def create_notion_task_in_project(tool_context: ToolContext, task_database_id: str,
+                                        project_database_id: str, project_name: str,
+                                        properties: dict, body: str) -> dict:
+    """Resolves a project by name and creates a task linked to it in one call.
+
+    Both database schemas are fetched concurrently, each only once, and the
+    project page id is written to the relation property of the task
+    database whose database_id is the project database. A value the caller
+    already set for that property is kept, and if no relation targets the
+    project database the task is created unlinked and the result says so.
+    A non-empty body is written as in create_notion_task: if writing it
+    fails part way, the result has status "partial" and the block index to
+    pass to append_notion_page_body to resume.
+    """
+    try:
+        # 并发获取任务数据库和项目数据库的属性结构
+        task_database_schema, project_database_schema = await asyncio.gather(
+            asyncio.to_thread(_retrieve_database_schema, task_database_id),
+            asyncio.to_thread(_retrieve_database_schema, project_database_id),
         )
-        
-        print(f"任务已成功创建，页面链接: {response.get('url')}")
-        return response.get('id')
+        task_schema = _property_types(task_database_schema)
+        project_schema = _property_types(project_database_schema)
+
+        title_property = _find_property_by_type(project_schema, "title")
+        if not title_property:
+            raise ValueError("Could not find title property in the project database")
+
+        project_page_id = await asyncio.to_thread(
+            _query_project_page_id, project_database_id, title_property, project_name
+        )
+        if not project_page_id:
+            print(f"No project found with name: {project_name}")
+            return {
+                "status": "project_not_found",
+                "project_name": project_name,
+            }
+
+        # 将项目ID写入任务数据库的关联属性
+        task_properties = dict(properties)
+        relation_property = _find_relation_to_database(task_database_schema, project_database_id)
+        if relation_property is None:
+            print(f"Warning: No relation property in task database targets project database {project_database_id}")
+        elif relation_property not in task_properties:
+            task_properties[relation_property] = project_page_id
+
+        formatted_properties = _format_task_properties(task_schema, task_properties)
+
+        # 创建页面，第一批正文块随页面一起创建，剩余部分在创建后按批追加
+        page = await _create_page_with_body(task_database_id, formatted_properties, body)
+        result = {
+            "status": page.pop("status"),
+            "task_id": page.pop("task_id"),
+            "url": page.pop("url"),
+            "project_id": project_page_id,
+            "relation_property": relation_property,
+            "project_linked": relation_property is not None,
+            "skipped_properties": [name for name in task_properties if name not in task_schema],
+            **page,
+        }
+        if relation_property is None:
+            result["warning"] = "No relation property in the task database targets the project database; the task was not linked to the project."
+        return result
     except Exception as e:
         print(f"创建任务时出错: {e}")
         raise ValueError(f"无法创建任务: {e}")
 
+async def append_notion_page_body(tool_context: ToolContext, page_id: str, body: str, start_block: int) -> dict:
+    """Appends body text to a page as paragraph blocks, starting at start_block.
+
+    The body is split the same way as in create_notion_task and
+    create_notion_task_in_project, so passing the same body with the
+    returned resume_from_block continues an interrupted write without
+    duplicating blocks. start_block must lie between 0 and the number of
+    blocks in the body.
+    """
+    blocks = _paragraph_blocks(body)
+    if not 0 <= start_block <= len(blocks):
+        print(f"Invalid start_block {start_block} for a body of {len(blocks)} blocks")
+        return {
+            "status": "error",
+            "page_id": page_id,
+            "body_blocks_total": len(blocks),
+            "error": f"start_block must be between 0 and {len(blocks)}, got {start_block}",
+        }
+    written, error = await _append_blocks(page_id, blocks, start_block)
+    if error is None:
+        print(f"Appended {written - start_block} blocks to page {page_id}")
+    return {"page_id": page_id, **_body_result(blocks, written, error)}
+
 # Note: These functions will be exposed as tools by the Agent that uses them.
 # The Agent definition will list these functions in its 'tools' parameter.
 
 async def main():
     """测试Notion工具的主要功能"""
-    import asyncio
     from unittest.mock import MagicMock
     
     # 从环境变量获取必要的配置
@@ -213,12 +512,11 @@ async def main():
                 task_properties[status_property] = "待处理"  # 假设存在"待处理"状态选项
             
             # 创建任务
-            task_id = await create_notion_task(mock_tool_context, task_database_id, task_properties)
-            print(f"创建的任务ID: {task_id}")
+            result = await create_notion_task(mock_tool_context, task_database_id, task_properties, "")
+            print(f"创建的任务ID: {result['task_id']}")
         
     except Exception as e:
         print(f"测试过程中出错: {e}")
 
 if __name__ == "__main__":
-    import asyncio
     asyncio.run(main())
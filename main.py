@@ -6,7 +6,6 @@ FastAPI web application with WebSocket support for streaming responses.
 """
 
 import os
-import json
 import asyncio
 from pathlib import Path
 from dotenv import load_dotenv
@@ -24,6 +23,9 @@ from google.adk.agents.run_config import RunConfig
 
 # 导入自定义组件
 from agents.core.runner_setup import setup_runner, session_service
+from agents.core.profiler import current_session_id
+from agents.core.admin import router as admin_router
+from agents.core.live_sessions import LiveSession, live_sessions
 from agents.agent import root_agent
 # TODO: Import WorkflowPlan model when needed
 # from src.models.workflow_plan import WorkflowPlan, WorkflowStep
@@ -43,6 +45,9 @@ STATIC_DIR = Path("static")
 if STATIC_DIR.exists():
     app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
 
+# 管理接口（需要 ADMIN_TOKEN）
+app.include_router(admin_router)
+
 def start_agent_session(session_id: str):
     """启动一个代理会话，使用现有的 session_service"""
     
@@ -72,36 +77,38 @@ def start_agent_session(session_id: str):
     
     return live_events, live_request_queue
 
-async def agent_to_client_messaging(websocket, live_events):
-    """代理到客户端的通信"""
-    while True:
-        async for event in live_events:
-            # 回合完成
-            if event.turn_complete:
-                await websocket.send_text(json.dumps({"turn_complete": True}))
-                print("[TURN COMPLETE]")
-                
-            # 中断
-            if event.interrupted:
-                await websocket.send_text(json.dumps({"interrupted": True}))
-                print("[INTERRUPTED]")
-                
-            # 读取 Content 和它的第一个 Part
-            part = (
-                event.content and event.content.parts and event.content.parts[0]
-            )
-            if not part or not event.partial:
-                continue
-                
-            # 获取文本
-            text = event.content and event.content.parts and event.content.parts[0].text
-            if not text:
-                continue
-                
-            # 将文本发送给客户端
-            await websocket.send_text(json.dumps({"message": text}))
-            print(f"[AGENT TO CLIENT]: {text}")
-            await asyncio.sleep(0)
+async def agent_to_client_messaging(live_session: LiveSession):
+    """代理到客户端的通信，消息经由会话缓冲区发送，断线期间继续运行
+
+    live_events 结束后函数返回，由会话的完成回调结束会话并通知客户端。
+    """
+    async for event in live_session.live_events:
+        # 回合完成
+        if event.turn_complete:
+            await live_session.send({"turn_complete": True})
+            print("[TURN COMPLETE]")
+            
+        # 中断
+        if event.interrupted:
+            await live_session.send({"interrupted": True})
+            print("[INTERRUPTED]")
+            
+        # 读取 Content 和它的第一个 Part
+        part = (
+            event.content and event.content.parts and event.content.parts[0]
+        )
+        if not part or not event.partial:
+            continue
+            
+        # 获取文本
+        text = event.content and event.content.parts and event.content.parts[0].text
+        if not text:
+            continue
+            
+        # 将文本发送给客户端
+        await live_session.send({"message": text})
+        print(f"[AGENT TO CLIENT]: {text}")
+        await asyncio.sleep(0)
 
 async def client_to_agent_messaging(websocket, live_request_queue):
     """客户端到代理的通信"""
@@ -123,31 +130,47 @@ async def root():
             "info": "Connect via WebSocket at /ws/{session_id}"}
 
 @app.websocket("/ws/{session_id}")
-async def websocket_endpoint(websocket: WebSocket, session_id: int):
-    """客户端 WebSocket 端点"""
+async def websocket_endpoint(websocket: WebSocket, session_id: int,
+                             last_seq: int | None = None, run_id: str | None = None):
+    """客户端 WebSocket 端点
+
+    重连时通过查询参数 last_seq 和 run_id 传入最后收到的消息序号及其所属运行，
+    服务端会先回放之后的消息，再继续实时推送。
+    若原运行已不存在，首帧的 reset 为 true，序号从头开始。
+    会话已有运行时，未携带匹配 run_id 的连接会以 4403 关闭，不能接管他人的会话。
+    """
     
     # 等待客户端连接
     await websocket.accept()
     print(f"Client #{session_id} connected")
     
-    # 启动代理会话
     session_id_str = str(session_id)
-    live_events, live_request_queue = start_agent_session(session_id_str)
-    
-    # 启动任务
-    agent_to_client_task = asyncio.create_task(
-        agent_to_client_messaging(websocket, live_events)
-    )
-    client_to_agent_task = asyncio.create_task(
-        client_to_agent_messaging(websocket, live_request_queue)
-    )
-    
+    # 标记当前会话，供采样分析器按会话过滤（子任务会继承该上下文）
+    current_session_id.set(session_id_str)
+
+    # 在宽限期内重连时复用仍在运行的代理会话，否则启动新会话
+    live_session = live_sessions.get(session_id_str)
+    if live_session is None:
+        live_events, live_request_queue = start_agent_session(session_id_str)
+        live_session = LiveSession(session_id_str, live_events, live_request_queue)
+        # 代理会话异常结束时从注册表移除，并通知已连接的客户端
+        live_session.start_pump(agent_to_client_messaging(live_session), live_sessions.discard)
+        live_sessions.add(live_session)
+    else:
+        print(f"Client #{session_id} resumed from seq {last_seq}")
+
     try:
-        await asyncio.gather(agent_to_client_task, client_to_agent_task)
+        await live_session.attach(websocket, last_seq, run_id)
+        await client_to_agent_messaging(websocket, live_session.live_request_queue)
+    except PermissionError as e:
+        # 未持有当前运行的 run_id，拒绝接管正在进行的会话
+        print(f"Client #{session_id} rejected: {e}")
+        await websocket.close(code=4403)
     except Exception as e:
         print(f"WebSocket error: {e}")
     finally:
-        # 断开连接
+        # 断开连接，代理会话在宽限期内保持运行
+        live_session.detach(websocket, live_sessions.expire)
         print(f"Client #{session_id} disconnected")
 
 # 保留原始的命令行应用函数
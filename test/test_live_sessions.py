@@ -0,0 +1,204 @@
+"""测试可恢复的 WebSocket 会话与回放缓冲区。"""
+
+import asyncio
+import json
+import os
+import sys
+import unittest
+from unittest.mock import MagicMock, patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from agents.core import live_sessions as live_sessions_module
+from agents.core.live_sessions import LiveSession, LiveSessionRegistry
+
+
+class FakeWebSocket:
+    """记录发送内容的模拟 WebSocket，可设置为发送失败。"""
+
+    def __init__(self):
+        self.frames = []
+        self.closed_with = None
+        self.fail = False
+
+    async def send_text(self, text):
+        if self.fail:
+            raise RuntimeError("connection closed")
+        self.frames.append(json.loads(text))
+
+    async def close(self, code=1000):
+        self.closed_with = code
+
+    def messages(self):
+        return [frame.get("message") for frame in self.frames if "seq" in frame]
+
+
+class TestLiveSession(unittest.IsolatedAsyncioTestCase):
+    """测试回放、断线分离、宽限期过期与连接接管。"""
+
+    def setUp(self):
+        self.registry = LiveSessionRegistry()
+        self.queue = MagicMock()
+        self.session = LiveSession("1", live_events=None, live_request_queue=self.queue)
+        self.registry.add(self.session)
+
+    async def _send(self, *texts):
+        for text in texts:
+            await self.session.send({"message": text})
+
+    async def test_replays_frames_after_last_seq(self):
+        """重连后只回放 last_seq 之后的帧，随后继续实时推送。"""
+        first = FakeWebSocket()
+        await self.session.attach(first)
+        await self._send("a", "b", "c")
+
+        second = FakeWebSocket()
+        await self.session.attach(second, last_seq=1, run_id=self.session.run_id)
+        await self._send("d")
+
+        self.assertEqual(second.frames[0], {"run_id": self.session.run_id, "reset": False})
+        self.assertEqual(second.messages(), ["b", "c", "d"])
+        self.assertEqual([frame["seq"] for frame in second.frames[1:]], [2, 3, 4])
+
+    async def test_reports_gap_when_buffer_overflowed(self):
+        """缓冲区已丢弃部分未收到的帧时先发送 replay_gap。"""
+        with patch.object(live_sessions_module, "REPLAY_BUFFER_SIZE", 2):
+            session = LiveSession("2", live_events=None, live_request_queue=MagicMock())
+        await session.attach(FakeWebSocket())
+        for text in "abcd":
+            await session.send({"message": text})
+
+        websocket = FakeWebSocket()
+        await session.attach(websocket, last_seq=1, run_id=session.run_id)
+
+        self.assertEqual(websocket.frames[1], {"replay_gap": True, "missed_from": 2, "missed_to": 2})
+        self.assertEqual(websocket.messages(), ["c", "d"])
+
+    async def test_send_failure_detaches_and_keeps_frames(self):
+        """发送失败时分离客户端，帧保留在缓冲区中供重连回放。"""
+        websocket = FakeWebSocket()
+        await self.session.attach(websocket)
+        websocket.fail = True
+        await self._send("a", "b")
+
+        self.assertIsNone(self.session.websocket)
+        reconnected = FakeWebSocket()
+        await self.session.attach(reconnected, last_seq=0, run_id=self.session.run_id)
+        self.assertEqual(reconnected.messages(), ["a", "b"])
+
+    async def test_expires_after_grace_period(self):
+        """宽限期内无人重连时关闭会话并从注册表移除。"""
+        websocket = FakeWebSocket()
+        await self.session.attach(websocket)
+        with patch.object(live_sessions_module, "SESSION_GRACE_PERIOD_S", 0.01):
+            self.session.detach(websocket, self.registry.expire)
+            await asyncio.sleep(0.05)
+
+        self.assertIsNone(self.registry.get("1"))
+        self.queue.close.assert_called_once()
+
+    async def test_reconnect_within_grace_period_cancels_expiry(self):
+        """宽限期内重连会取消过期。"""
+        websocket = FakeWebSocket()
+        await self.session.attach(websocket)
+        with patch.object(live_sessions_module, "SESSION_GRACE_PERIOD_S", 0.05):
+            self.session.detach(websocket, self.registry.expire)
+            await self.session.attach(FakeWebSocket(), last_seq=0, run_id=self.session.run_id)
+            await asyncio.sleep(0.1)
+
+        self.assertIs(self.registry.get("1"), self.session)
+        self.queue.close.assert_not_called()
+
+    async def test_second_connection_takes_over(self):
+        """新连接接管会话，旧连接被关闭且不再收到消息。"""
+        first = FakeWebSocket()
+        await self.session.attach(first)
+        second = FakeWebSocket()
+        await self.session.attach(second, last_seq=0, run_id=self.session.run_id)
+        await self._send("a")
+
+        self.assertIsNotNone(first.closed_with)
+        self.assertEqual(first.messages(), [])
+        self.assertEqual(second.messages(), ["a"])
+
+        # 旧连接断开不会影响新连接
+        self.session.detach(first, self.registry.expire)
+        self.assertIs(self.session.websocket, second)
+
+    async def test_resume_on_new_run_sends_reset(self):
+        """客户端携带 last_seq 连接到新运行时收到 reset，序号从头开始。"""
+        websocket = FakeWebSocket()
+        await self.session.attach(websocket, last_seq=50, run_id="previous-run")
+        await self._send("a")
+
+        self.assertEqual(websocket.frames[0], {"run_id": self.session.run_id, "reset": True})
+        self.assertEqual(websocket.frames[1]["seq"], 1)
+
+    async def test_rejects_takeover_without_matching_run_id(self):
+        """会话已有客户端后，未携带或携带错误 run_id 的连接被拒绝，原连接不受影响。"""
+        owner = FakeWebSocket()
+        await self.session.attach(owner)
+        await self._send("secret")
+
+        for run_id in (None, "guessed-run", "运行"):
+            intruder = FakeWebSocket()
+            with self.assertRaises(PermissionError):
+                await self.session.attach(intruder, last_seq=0, run_id=run_id)
+            self.assertEqual(intruder.frames, [])
+
+        self.assertIs(self.session.websocket, owner)
+        self.assertIsNone(owner.closed_with)
+
+    async def test_rejected_takeover_keeps_grace_period(self):
+        """被拒绝的连接不会取消原会话的过期计时。"""
+        owner = FakeWebSocket()
+        await self.session.attach(owner)
+        with patch.object(live_sessions_module, "SESSION_GRACE_PERIOD_S", 0.02):
+            self.session.detach(owner, self.registry.expire)
+            intruder = FakeWebSocket()
+            with self.assertRaises(PermissionError):
+                await self.session.attach(intruder)
+            self.session.detach(intruder, self.registry.expire)
+            await asyncio.sleep(0.05)
+
+        self.assertIsNone(self.registry.get("1"))
+        self.queue.close.assert_called_once()
+
+    async def test_failed_live_run_ends_session(self):
+        """实时运行异常结束时移除会话，并向客户端发送错误后关闭连接。"""
+        websocket = FakeWebSocket()
+        await self.session.attach(websocket)
+
+        async def failing_pump():
+            raise RuntimeError("quota exceeded")
+
+        self.session.start_pump(failing_pump(), self.registry.discard)
+        await asyncio.sleep(0.01)
+
+        self.assertIsNone(self.registry.get("1"))
+        self.assertEqual(websocket.frames[-1], {"error": "quota exceeded", "run_id": self.session.run_id})
+        self.assertEqual(websocket.closed_with, 1011)
+        self.queue.close.assert_called_once()
+
+        # 连接随后断开时不再安排过期
+        self.session.detach(websocket, self.registry.expire)
+        self.assertIsNone(self.session._expiry_task)
+
+    async def test_live_run_ending_normally_ends_session(self):
+        """live_events 正常结束时同样移除会话并通知客户端。"""
+        websocket = FakeWebSocket()
+        await self.session.attach(websocket)
+
+        async def finished_pump():
+            return None
+
+        self.session.start_pump(finished_pump(), self.registry.discard)
+        await asyncio.sleep(0.01)
+
+        self.assertIsNone(self.registry.get("1"))
+        self.assertEqual(websocket.frames[-1], {"error": "Live run ended", "run_id": self.session.run_id})
+        self.assertEqual(websocket.closed_with, 1011)
+
+
+if __name__ == "__main__":
+    unittest.main()
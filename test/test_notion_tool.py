@@ -0,0 +1,296 @@
+"""测试Notion工具中的文本分段与分批逻辑。"""
+
+import os
+import sys
+import unittest
+from unittest.mock import MagicMock, patch
+
+import httpx
+from notion_client.errors import APIErrorCode, APIResponseError
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from agents.tools import notion_tool
+
+
+class TestNotionTextChunking(unittest.TestCase):
+    """测试长文本被拆分为符合Notion限制的片段和块。"""
+
+    def test_split_text_respects_limit_and_round_trips(self):
+        """分段后每段不超过上限，且拼接后与原文一致。"""
+        text = ("word " * 900 + "\n") * 3
+        chunks = notion_tool._split_text(text)
+        self.assertTrue(all(len(chunk) <= notion_tool.MAX_RICH_TEXT_CONTENT for chunk in chunks))
+        self.assertEqual("".join(chunks), text)
+
+    def test_split_text_counts_utf16_units(self):
+        """按 UTF-16 码元计算长度，且不会拆开代理对。"""
+        text = "😀" * 2500
+        chunks = notion_tool._split_text(text)
+        self.assertTrue(all(len(chunk.encode("utf-16-le")) // 2 <= 2000 for chunk in chunks))
+        self.assertEqual([len(chunk) for chunk in chunks], [1000, 1000, 500])
+        self.assertEqual("".join(chunks), text)
+
+    def test_rich_text_segments_rejects_oversized_payload(self):
+        """段数未超限但序列化后的字节数超限时同样抛出异常。"""
+        text = "任" * (notion_tool.MAX_RICH_TEXT_SEGMENTS * notion_tool.MAX_RICH_TEXT_CONTENT)
+        with self.assertRaises(ValueError):
+            notion_tool._rich_text_segments(text)
+
+    def test_split_text_hard_cuts_without_whitespace(self):
+        """没有空白字符时按上限硬切分。"""
+        chunks = notion_tool._split_text("任" * 4500)
+        self.assertEqual([len(chunk) for chunk in chunks], [2000, 2000, 500])
+
+    def test_rich_text_segments_rejects_oversized_text(self):
+        """超过属性可容纳的总长度时抛出异常。"""
+        limit = notion_tool.MAX_RICH_TEXT_SEGMENTS * notion_tool.MAX_RICH_TEXT_CONTENT
+        with self.assertRaises(ValueError):
+            notion_tool._rich_text_segments("x" * (limit + 1))
+
+    def test_paragraph_blocks_and_batches(self):
+        """正文按段落转换为块，并按请求上限分批。"""
+        body = "\n\n".join(f"段落 {i}" for i in range(250))
+        blocks = notion_tool._paragraph_blocks(body)
+        self.assertEqual(len(blocks), 250)
+        self.assertEqual(notion_tool._next_batch_end(blocks, 0), notion_tool.MAX_BLOCKS_PER_REQUEST)
+        self.assertEqual(notion_tool._next_batch_end(blocks, 200), 250)
+
+
+TASK_DB_ID = "task-db"
+PROJECT_DB_ID = "1234abcd-0000-0000-0000-000000000000"
+
+TASK_DB_SCHEMA = {
+    "Name": {"type": "title", "title": {}},
+    "Status": {"type": "status", "status": {}},
+    "Parent task": {"type": "relation", "relation": {"database_id": TASK_DB_ID}},
+    "Project": {"type": "relation", "relation": {"database_id": PROJECT_DB_ID.replace("-", "")}},
+}
+PROJECT_DB_SCHEMA = {
+    "Project name": {"type": "title", "title": {}},
+}
+
+
+def _mock_client(task_schema=TASK_DB_SCHEMA, project_results=({"id": "project-page"},)):
+    """构造一个按数据库ID返回属性结构的模拟Notion客户端。"""
+    client = MagicMock()
+    schemas = {TASK_DB_ID: task_schema, PROJECT_DB_ID: PROJECT_DB_SCHEMA}
+    client.databases.retrieve.side_effect = lambda database_id: {"properties": schemas[database_id]}
+    client.databases.query.return_value = {"results": list(project_results)}
+    client.pages.create.return_value = {"id": "task-page", "url": "https://notion.so/task-page"}
+    return client
+
+
+class TestCreateNotionTaskInProject(unittest.IsolatedAsyncioTestCase):
+    """测试组合工具一次调用完成项目查找与任务创建。"""
+
+    async def _create(self, client, properties, body=""):
+        with patch.object(notion_tool, "_get_notion_client", return_value=client):
+            return await notion_tool.create_notion_task_in_project(
+                MagicMock(), TASK_DB_ID, PROJECT_DB_ID, "Apollo", properties, body
+            )
+
+    async def test_fetches_each_schema_once_and_links_project_relation(self):
+        """每个数据库结构只获取一次，项目ID写入指向项目数据库的关联属性。"""
+        client = _mock_client()
+        result = await self._create(client, {"Name": "Write spec", "Status": "Todo"})
+
+        retrieved = sorted(call.kwargs["database_id"] for call in client.databases.retrieve.call_args_list)
+        self.assertEqual(retrieved, sorted([TASK_DB_ID, PROJECT_DB_ID]))
+        self.assertEqual(client.databases.query.call_args.kwargs["filter"]["property"], "Project name")
+
+        properties = client.pages.create.call_args.kwargs["properties"]
+        self.assertEqual(properties["Project"], {"relation": [{"id": "project-page"}]})
+        self.assertNotIn("Parent task", properties)
+        self.assertEqual(result["status"], "success")
+        self.assertEqual(result["task_id"], "task-page")
+        self.assertEqual(result["relation_property"], "Project")
+        self.assertTrue(result["project_linked"])
+
+    async def test_project_not_found(self):
+        """未找到项目时返回结构化结果且不创建任务。"""
+        client = _mock_client(project_results=())
+        result = await self._create(client, {"Name": "Write spec"})
+
+        self.assertEqual(result, {"status": "project_not_found", "project_name": "Apollo"})
+        client.pages.create.assert_not_called()
+
+    async def test_keeps_relation_set_by_caller(self):
+        """调用方显式设置的关联属性不会被覆盖。"""
+        client = _mock_client()
+        await self._create(client, {"Name": "Write spec", "Project": ["other-project"]})
+
+        properties = client.pages.create.call_args.kwargs["properties"]
+        self.assertEqual(properties["Project"], {"relation": [{"id": "other-project"}]})
+
+    async def test_reports_skipped_properties(self):
+        """数据库中不存在的属性会被跳过并在结果中列出。"""
+        client = _mock_client()
+        result = await self._create(client, {"Name": "Write spec", "Owner": "alice"})
+
+        self.assertEqual(result["skipped_properties"], ["Owner"])
+        self.assertNotIn("Owner", client.pages.create.call_args.kwargs["properties"])
+
+    async def test_reports_missing_project_relation_instead_of_guessing(self):
+        """没有指向项目数据库的关联属性时不猜测，并在结果中说明。"""
+        task_schema = {name: details for name, details in TASK_DB_SCHEMA.items() if name != "Project"}
+        client = _mock_client(task_schema=task_schema)
+        result = await self._create(client, {"Name": "Write spec"})
+
+        properties = client.pages.create.call_args.kwargs["properties"]
+        self.assertNotIn("Parent task", properties)
+        self.assertIsNone(result["relation_property"])
+        self.assertFalse(result["project_linked"])
+        self.assertIn("warning", result)
+
+
+def _api_error(status, code):
+    """构造 Notion API 返回的错误。"""
+    return APIResponseError(httpx.Response(status), f"HTTP {status}", code)
+
+
+class TestTaskBodyStreaming(unittest.IsolatedAsyncioTestCase):
+    """测试正文分批写入、部分失败与续写。"""
+
+    def setUp(self):
+        patcher = patch.object(notion_tool, "BLOCK_APPEND_BACKOFF_S", 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _appended_contents(self, client):
+        return [
+            block["paragraph"]["rich_text"][0]["text"]["content"]
+            for call in client.blocks.children.append.call_args_list
+            for block in call.kwargs["children"]
+        ]
+
+    async def _create(self, client, properties, body):
+        with patch.object(notion_tool, "_get_notion_client", return_value=client):
+            return await notion_tool.create_notion_task_in_project(
+                MagicMock(), TASK_DB_ID, PROJECT_DB_ID, "Apollo", properties, body
+            )
+
+    async def test_first_batch_rides_on_page_creation(self):
+        """第一批块随 pages.create 发送，剩余块创建后追加。"""
+        client = _mock_client()
+        body = "\n\n".join(f"p{i}" for i in range(150))
+        result = await self._create(client, {"Name": "Spec"}, body)
+
+        children = client.pages.create.call_args.kwargs["children"]
+        self.assertEqual(len(children), notion_tool.MAX_BLOCKS_PER_REQUEST)
+        self.assertEqual(self._appended_contents(client), [f"p{i}" for i in range(100, 150)])
+        self.assertEqual(result["status"], "success")
+        self.assertEqual((result["body_blocks_total"], result["body_blocks_written"]), (150, 150))
+
+    async def test_first_batch_budget_excludes_properties(self):
+        """属性较大时第一批块减少，页面创建请求体不超过预算。"""
+        client = _mock_client()
+        properties = {"Name": "任" * 100000}
+        body = "\n\n".join("字" * 2000 for _ in range(30))
+        result = await self._create(client, properties, body)
+
+        create_kwargs = client.pages.create.call_args.kwargs
+        payload_size = notion_tool._json_size(create_kwargs["properties"]) + notion_tool._json_size(
+            create_kwargs.get("children", [])
+        )
+        self.assertLessEqual(payload_size, notion_tool.MAX_REQUEST_BYTES)
+        self.assertLess(len(create_kwargs.get("children", [])), 30)
+        self.assertEqual(result["body_blocks_written"], 30)
+
+    async def test_partial_failure_then_resume_without_duplicates(self):
+        """追加失败时返回 partial，续写后每个块恰好写入一次。"""
+        client = _mock_client()
+        client.blocks.children.append.side_effect = [_api_error(400, APIErrorCode.ValidationError)]
+        body = "\n\n".join(f"p{i}" for i in range(250))
+        result = await self._create(client, {"Name": "Spec"}, body)
+
+        # 非可重试错误立即失败，不做重试
+        self.assertEqual(client.blocks.children.append.call_count, 1)
+        self.assertEqual(result["status"], "partial")
+        self.assertEqual(result["resume_from_block"], 100)
+        self.assertEqual(result["body_blocks_written"], 100)
+
+        client.blocks.children.append.reset_mock(side_effect=True)
+        with patch.object(notion_tool, "_get_notion_client", return_value=client):
+            resumed = await notion_tool.append_notion_page_body(
+                MagicMock(), result["task_id"], body, result["resume_from_block"]
+            )
+
+        self.assertEqual(resumed["status"], "success")
+        self.assertEqual(resumed["body_blocks_written"], 250)
+        self.assertEqual(self._appended_contents(client), [f"p{i}" for i in range(100, 250)])
+
+    async def test_retries_rate_limited_batches(self):
+        """限流错误会重试，重试成功后继续写入。"""
+        client = MagicMock()
+        client.blocks.children.append.side_effect = [
+            _api_error(429, APIErrorCode.RateLimited), {}, {},
+        ]
+        blocks = notion_tool._paragraph_blocks("\n\n".join(f"p{i}" for i in range(150)))
+        with patch.object(notion_tool, "_get_notion_client", return_value=client):
+            written, error = await notion_tool._append_blocks("page", blocks)
+
+        self.assertEqual((written, error), (150, None))
+        self.assertEqual(client.blocks.children.append.call_count, 3)
+
+
+class TestCreateNotionTaskBody(unittest.IsolatedAsyncioTestCase):
+    """测试不关联项目的任务创建同样支持正文写入与续写。"""
+
+    def setUp(self):
+        patcher = patch.object(notion_tool, "BLOCK_APPEND_BACKOFF_S", 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_create_task_with_body_and_partial_failure(self):
+        """第一批块随页面创建，追加失败时返回 partial 与 resume_from_block。"""
+        client = _mock_client()
+        client.blocks.children.append.side_effect = [_api_error(400, APIErrorCode.ValidationError)]
+        body = "\n\n".join(f"p{i}" for i in range(150))
+        with patch.object(notion_tool, "_get_notion_client", return_value=client):
+            result = await notion_tool.create_notion_task(MagicMock(), TASK_DB_ID, {"Name": "Spec"}, body)
+
+        self.assertEqual(len(client.pages.create.call_args.kwargs["children"]), 100)
+        self.assertEqual(result["status"], "partial")
+        self.assertEqual(result["task_id"], "task-page")
+        self.assertEqual(result["resume_from_block"], 100)
+        self.assertEqual(result["body_blocks_total"], 150)
+
+    async def test_create_task_without_body(self):
+        """没有正文时不发送子块。"""
+        client = _mock_client()
+        with patch.object(notion_tool, "_get_notion_client", return_value=client):
+            result = await notion_tool.create_notion_task(MagicMock(), TASK_DB_ID, {"Name": "Spec"}, "")
+
+        self.assertNotIn("children", client.pages.create.call_args.kwargs)
+        client.blocks.children.append.assert_not_called()
+        self.assertEqual(result["status"], "success")
+
+    async def test_retries_transport_errors(self):
+        """连接重置等传输错误会重试。"""
+        client = MagicMock()
+        client.blocks.children.append.side_effect = [httpx.ConnectError("connection reset"), {}]
+        blocks = notion_tool._paragraph_blocks("p0\n\np1")
+        with patch.object(notion_tool, "_get_notion_client", return_value=client):
+            written, error = await notion_tool._append_blocks("page", blocks)
+
+        self.assertEqual((written, error), (2, None))
+        self.assertEqual(client.blocks.children.append.call_count, 2)
+
+    async def test_append_rejects_out_of_range_start_block(self):
+        """start_block 超出范围时返回错误且不发送请求。"""
+        client = MagicMock()
+        body = "p0\n\np1\n\np2"
+        with patch.object(notion_tool, "_get_notion_client", return_value=client):
+            for start_block in (-1, 4):
+                result = await notion_tool.append_notion_page_body(MagicMock(), "page", body, start_block)
+                self.assertEqual(result["status"], "error")
+            at_end = await notion_tool.append_notion_page_body(MagicMock(), "page", body, 3)
+
+        client.blocks.children.append.assert_not_called()
+        self.assertEqual(at_end["status"], "success")
+        self.assertEqual(at_end["body_blocks_written"], 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+"""测试采样分析器的报告生成与管理接口。"""
+
+import asyncio
+import os
+import sys
+import unittest
+from collections import Counter
+from unittest.mock import patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from agents.core import admin
+from agents.core.profiler import SamplingProfiler
+
+
+class TestSamplingProfilerReport(unittest.TestCase):
+    """测试折叠栈与 top-N 统计。"""
+
+    def test_report_counts_self_and_total(self):
+        """self 只统计栈顶函数，total 对同一栈中的递归调用只计一次。"""
+        profiler = SamplingProfiler()
+        profiler._loop_stacks = Counter({"main;handle;encode": 3, "main;handle": 1})
+        profiler._thread_stacks = Counter({"worker;encode;encode": 2})
+        profiler._loop_samples, profiler._thread_samples = 4, 2
+
+        report = profiler.report(top=2)
+
+        self.assertEqual(report["samples"], 6)
+        self.assertEqual(report["collapsed"].splitlines(), [
+            "main;handle;encode 3",
+            "worker;encode;encode 2",
+            "main;handle 1",
+        ])
+        self.assertEqual(report["top"][0], {
+            "function": "encode", "self": 5, "total": 5, "self_pct": 83.33, "total_pct": 83.33,
+        })
+        self.assertEqual(report["top"][1]["function"], "handle")
+        self.assertEqual((report["top"][1]["self"], report["top"][1]["total"]), (1, 4))
+        self.assertEqual(len(report["top"]), 2)
+
+    def test_start_while_running_raises(self):
+        """已在运行时再次启动会报错，停止后可以重新启动。"""
+        profiler = SamplingProfiler()
+
+        async def run():
+            profiler.start(interval_ms=5, duration_s=5)
+            with self.assertRaises(RuntimeError):
+                profiler.start(interval_ms=5, duration_s=5)
+            await asyncio.to_thread(profiler.stop)
+            self.assertFalse(profiler.running)
+            profiler.start(interval_ms=5, duration_s=5)
+            await asyncio.to_thread(profiler.stop)
+
+        asyncio.run(run())
+
+
+class TestAdminProfilerRoutes(unittest.TestCase):
+    """测试管理接口的鉴权与冲突处理。"""
+
+    def setUp(self):
+        app = FastAPI()
+        app.include_router(admin.router)
+        self.client = TestClient(app)
+        self.profiler = SamplingProfiler()
+        patcher = patch.object(admin, "profiler", self.profiler)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_routes_hidden_without_admin_token(self):
+        """未配置 ADMIN_TOKEN 时返回 404。"""
+        with patch.dict(os.environ, {}, clear=True):
+            response = self.client.get("/admin/profiler", headers={"X-Admin-Token": "anything"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_rejects_wrong_token(self):
+        """令牌错误或缺失时返回 403。"""
+        with patch.dict(os.environ, {"ADMIN_TOKEN": "secret"}):
+            self.assertEqual(self.client.get("/admin/profiler", headers={"X-Admin-Token": "wrong"}).status_code, 403)
+            self.assertEqual(self.client.get("/admin/profiler").status_code, 403)
+
+    def test_start_twice_returns_conflict(self):
+        """运行中再次启动返回 409，停止后返回报告。"""
+        headers = {"X-Admin-Token": "secret"}
+        with patch.dict(os.environ, {"ADMIN_TOKEN": "secret"}):
+            started = self.client.post("/admin/profiler/start?interval_ms=5&duration_s=5", headers=headers)
+            conflict = self.client.post("/admin/profiler/start", headers=headers)
+            stopped = self.client.post("/admin/profiler/stop?top=5", headers=headers)
+
+        self.assertEqual(started.status_code, 200)
+        self.assertTrue(started.json()["running"])
+        self.assertEqual(conflict.status_code, 409)
+        self.assertEqual(stopped.status_code, 200)
+        self.assertFalse(stopped.json()["running"])
+        self.assertIn("collapsed", stopped.json())
+
+
+if __name__ == "__main__":
+    unittest.main()